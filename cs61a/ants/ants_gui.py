@@ -20,10 +20,11 @@ how many bees remain in the hive.
 
 import ants
 import graphics
+from collections import defaultdict
+from functools import lru_cache
 from graphics import shift_point
 from ucb import *
-from math import pi
-import math
+from math import pi, cos, sin
 import os
 import random
 
@@ -56,6 +57,9 @@ CRYPT = 650
 MESSAGE_POS = (120, 20)
 HIVE_HEIGHT = 300
 PLACE_MARGIN = 10
+CLICK_CELL_SIZE = 64
+LEAF_DURATION = 0.3
+DART_DURATION = 0.5
 LEAF_START_OFFSET = (30, 30)
 LEAF_END_OFFSET = (35, 30)
 LEAF_COLORS = {'Thrower': 'ForestGreen',
@@ -72,14 +76,24 @@ class AntsGUI(object):
 
     def __init__(self):
         self.initialized = False
+        # self._place_state: place_name -> (ant, contained ant, bees) last drawn
+        self._place_state = dict()
+        self._dirty = True  # Whether the canvas may be out of date
+        self._food_time = None  # (food, time) shown in the food label
+        self._pending_clear = []  # (delay, shape id) of thrown projectiles
 
     def initialize_colony_graphics(self, colony):
         """Create canvas, control panel, places, and labels."""
         self.initialized = True
         self.canvas = graphics.Canvas()
+        # Decode every image once up front rather than on first draw
+        for image_file in set(INSECT_FILES.values()) | {TUNNEL_FILE}:
+            self.canvas.load_image(image_file)
         self.food_text = self.canvas.draw_text('Food: 1  Time: 0', (20, 20))
         self.ant_text = self.canvas.draw_text('Ant selected: None', (20, 140))
         self._click_rectangles = list()
+        # self._click_cells: (column, row) -> click rectangles overlapping it
+        self._click_cells = defaultdict(list)
         self._init_control_panel(colony)
         self._init_places(colony)
 
@@ -91,32 +105,37 @@ class AntsGUI(object):
     def _init_control_panel(self, colony):
         """Construct the control panel of available ant types."""
         self.ant_type_selected = None
-        self.ant_type_frames = []  # rectangle ids of frames.
-        panel_pos = PANEL_POS
+        self.ant_type_frames = []  # (name, ant type, rectangle id of frame)
+        self._frame_color = dict()  # frame -> fill color last configured
+        self._ant_text_msg = None  # message shown in the ant text label
+        x, y = PANEL_POS
+        width = ANT_IMAGE_WIDTH + 2 * PANEL_PADDING[0]
+        height = ANT_IMAGE_HEIGHT + 6 + 2 * PANEL_PADDING[1]
         for name, ant_type in colony.ant_types.items():
-            width = ANT_IMAGE_WIDTH + 2 * PANEL_PADDING[0]
-            height = ANT_IMAGE_HEIGHT + 6 + 2 * PANEL_PADDING[1]
             def on_click(colony, frame, name=name):
                 self.ant_type_selected = name
-                self._update_control_panel(colony)
 
-            frame = self.add_click_rect(panel_pos, width, height, on_click)
-            self.ant_type_frames.append((name, frame))
-            img_pos = shift_point(panel_pos, PANEL_PADDING)
+            frame = self.add_click_rect((x, y), width, height, on_click)
+            self.ant_type_frames.append((name, ant_type, frame))
+            img_pos = (x + PANEL_PADDING[0], y + PANEL_PADDING[1])
             self.canvas.draw_image(img_pos, INSECT_FILES[name])
-            cost_pos = shift_point(panel_pos, (width / 2, ANT_IMAGE_HEIGHT + 4
-                + PANEL_PADDING[1]))
+            cost_pos = (x + width / 2,
+                        y + ANT_IMAGE_HEIGHT + 4 + PANEL_PADDING[1])
             food_str = str(ant_type.food_cost)
             self.canvas.draw_text(food_str, cost_pos, anchor="center")
-            panel_pos = shift_point(panel_pos, (width + 2, 0))
+            x += width + 2
 
 
     def _init_places(self, colony):
         """Construct places in the play area."""
         self.place_points = dict()
-        # self.images: place_name -> insect instance -> image id
-        self.images = {'AntQueen': dict()}
-        place_pos = PLACE_POS
+        # self._image_of: (place_name, insect instance) -> image id
+        # Insects are held strongly: an expired insect must stay known until
+        # _update_places moves its image to the crypt and drops the entry.
+        self._image_of = dict()
+        # self._place_insects: place_name -> set of insects drawn there
+        self._place_insects = defaultdict(set)
+        x, y = PLACE_POS
         width = BEE_IMAGE_WIDTH + 2 * PLACE_PADDING[0]
         height = ANT_IMAGE_HEIGHT + 2 * PLACE_PADDING[1]
         rows = 0
@@ -124,8 +143,7 @@ class AntsGUI(object):
             if place.name == 'Hive':
                 continue  # Handled as a special case later
             if place.exit.name == 'AntQueen':
-                row_offset = (0, rows * (height + PLACE_MARGIN))
-                place_pos = shift_point(PLACE_POS, row_offset)
+                x, y = PLACE_POS[0], PLACE_POS[1] + rows * (height + PLACE_MARGIN)
                 rows += 1
             def on_click(colony, frame, name=name):
                 ant_type = self.ant_type_selected
@@ -134,27 +152,31 @@ class AntsGUI(object):
                     if existing_ant is not None:
                         print("colony.remove_ant('{0}')".format(name))
                         colony.remove_ant(name)
-                        self._update_places(colony)
                 elif ant_type is not None:
                     try:
                         print("colony.deploy_ant('{0}', '{1}')".format(name,
                                                                        ant_type))
                         colony.deploy_ant(name, ant_type)
-                        self._update_places(colony)
                     except Exception as e:
                         print(e)
+            place_pos = (x, y)
             color = 'Blue' if place.name.startswith('water') else 'White'
             frame = self.add_click_rect(place_pos, width, height, on_click,
                                              color=color)
             self.canvas.draw_image(place_pos, TUNNEL_FILE)
             self.place_points[name] = place_pos
-            self.images[name] = dict()
-            place_pos = shift_point(place_pos, (width + PLACE_MARGIN, 0))
+            x += width + PLACE_MARGIN
 
         # Hive
-        self.images[colony.hive.name] = dict()
-        self.place_points[colony.hive.name] = (place_pos[0] + width,
-                                               HIVE_HEIGHT)
+        self.place_points[colony.hive.name] = (x + width, HIVE_HEIGHT)
+
+        # Positions within each place used when drawing and throwing
+        points = self.place_points.items()
+        self._pos_padded = {n: shift_point(p, PLACE_PADDING) for n, p in points}
+        self._pos_leaf_start = {n: shift_point(p, LEAF_START_OFFSET)
+                                for n, p in points}
+        self._pos_leaf_end = {n: shift_point(p, LEAF_END_OFFSET)
+                              for n, p in points}
         for bee in colony.hive.bees:
             self._draw_insect(bee, colony.hive.name, True)
 
@@ -163,52 +185,87 @@ class AntsGUI(object):
         """Construct a rectangle that can be clicked."""
         frame_points = graphics.rectangle_points(pos, width, height)
         frame = self.canvas.draw_polygon(frame_points, fill_color=color)
-        self._click_rectangles.append((pos, width, height, frame, on_click))
+        rect = (pos, width, height, frame, on_click)
+        self._click_rectangles.append(rect)
+        x, y = pos
+        for gx in range(int(x // CLICK_CELL_SIZE),
+                        int((x + width) // CLICK_CELL_SIZE) + 1):
+            for gy in range(int(y // CLICK_CELL_SIZE),
+                            int((y + height) // CLICK_CELL_SIZE) + 1):
+                self._click_cells[(gx, gy)].append(rect)
         return frame
 
     def strategy(self, colony):
         """The strategy function is called by the ants.AntColony each turn."""
         if not self.initialized:
             self.initialize_colony_graphics(colony)
+        self._dirty = True  # The colony has changed since the last turn
         elapsed = 0  # Physical time elapsed this turn
         while elapsed < STRATEGY_SECONDS:
-            self._update_control_panel(colony)
-            self._update_places(colony)
-            msg = 'Food: {0}  Time: {1}'.format(colony.food, colony.time)
-            self.canvas.edit_text(self.food_text, text=msg)
+            if self._dirty:
+                self._update_control_panel(colony)
+                self._update_places(colony)
+                self._update_food_text(colony)
+                self._dirty = False
             pos, el = self.canvas.wait_for_click(STRATEGY_SECONDS - elapsed)
             elapsed += el
             if pos is not None:
-                self._interpret_click(pos, colony)
-
-        # Throw leaves at the end of the turn
-        has_ant = lambda a: hasattr(a, 'ant') and a.ant
-        for ant in colony.ants + [a.ant for a in colony.ants if has_ant(a)]:
-            if ant.name in LEAF_COLORS:
-                self._throw(ant, colony)
-            elif ant.name == 'Ninja':
-                self._throw_dart(ant, colony)
+                # Handle every queued click before redrawing once
+                for click in [pos] + self.canvas.take_clicks():
+                    self._interpret_click(click, colony)
+        if self._dirty:
+            # Draw ants deployed on the last frame before they throw
+            self._update_control_panel(colony)
+            self._update_places(colony)
+            self._update_food_text(colony)
+            self._dirty = False
+
+        # Throw leaves at the end of the turn, including from contained ants
+        for container in colony.ants:
+            for ant in (container, getattr(container, 'ant', None)):
+                if ant is None:
+                    continue
+                if ant.name in LEAF_COLORS:
+                    self._throw(ant, colony)
+                elif ant.name == 'Ninja':
+                    self._throw_dart(ant, colony)
+        self._clear_thrown()
 
     def _interpret_click(self, pos, colony):
         """Interpret a click position by finding its click rectangle."""
         x, y = pos
-        for corner, width, height, frame, on_click in self._click_rectangles:
+        cell = (x // CLICK_CELL_SIZE, y // CLICK_CELL_SIZE)
+        candidates = self._click_cells.get(cell, self._click_rectangles)
+        for corner, width, height, frame, on_click in candidates:
             cx, cy = corner
             if x >= cx and x <= cx + width and y >= cy and y <= cy + height:
                 on_click(colony, frame)
+                self._dirty = True
+
+    def _update_food_text(self, colony):
+        """Reflect the colony's food and time in the food label."""
+        food_time = (colony.food, colony.time)
+        if food_time != self._food_time:
+            msg = 'Food: {0}  Time: {1}'.format(*food_time)
+            self.canvas.edit_text(self.food_text, text=msg)
+            self._food_time = food_time
 
     def _update_control_panel(self, colony):
         """Reflect the game state in the control panel."""
-        for name, frame in self.ant_type_frames:
-            cost = colony.ant_types[name].food_cost
+        for name, ant_type, frame in self.ant_type_frames:
+            cost = ant_type.food_cost
             color = 'White'
             if cost > colony.food:
                 color = 'Gray'
             elif name == self.ant_type_selected:
                 color = 'Blue'
                 msg = 'Ant selected: {0}'.format(name)
-                self.canvas.edit_text(self.ant_text, text=msg)
-            self.canvas._canvas.itemconfigure(frame, fill=color)
+                if msg != self._ant_text_msg:
+                    self.canvas.edit_text(self.ant_text, text=msg)
+                    self._ant_text_msg = msg
+            if self._frame_color.get(frame) != color:
+                self.canvas._canvas.itemconfigure(frame, fill=color)
+                self._frame_color[frame] = color
 
     def _update_places(self, colony):
         """Reflect the game state in the play area.
@@ -221,106 +278,144 @@ class AntsGUI(object):
         for name, place in colony.places.items():
             if place.name == 'Hive':
                 continue
-            current = self.images[name].keys()
+            # Skip places whose occupants are unchanged since the last update
+            state = (place.ant, getattr(place.ant, 'ant', None),
+                     frozenset(place.bees))
+            if self._place_state.get(name) == state:
+                continue
+            place_point = self.place_points[name]
+            current = self._place_insects[name]
 
             # Add/move missing insects
             if place.ant is not None:
+                if place.ant not in current:
+                    self._draw_insect(place.ant, name)
                 if hasattr(place.ant, 'container') and place.ant.container \
                     and place.ant.ant and place.ant.ant not in current:
-                    container = self.images[name][place.ant]
+                    container = self._image_of[(name, place.ant)]
                     self._draw_insect(place.ant.ant, name, behind=container)
-                if place.ant not in current:
-                    self._draw_insect(place.ant, name)
             for bee in place.bees:
                 if bee not in current:
-                    for other_place in colony.places.values():
-                        if other_place.exit is place:
-                            break
-                    else:
-                        other_place = colony.hive
-                    image = self.images[other_place.name].pop(bee)
-                    pos = shift_point(self.place_points[name], PLACE_PADDING)
+                    other_place = place.entrance
+                    image = self._image_of.pop((other_place.name, bee))
+                    self._place_insects[other_place.name].discard(bee)
+                    pos = self._pos_padded[name]
                     self.canvas.slide_shape(image, pos, STRATEGY_SECONDS)
-                    self.images[name][bee] = image
+                    self._image_of[(name, bee)] = image
+                    current.add(bee)
 
             # Remove expired insects
-            valid_insects = set(place.bees + [place.ant])
-            if place.ant is not None and hasattr(place.ant, 'container') and \
-                place.ant.container:
-                valid_insects.add(place.ant.ant)
+            ant, contained_ant, bees = state
+            valid_insects = {ant, contained_ant, *bees}
             for insect in current - valid_insects:
-                if not place.exit or insect not in self.images[place.exit.name]:
-                    image = self.images[name].pop(insect)
-                    pos = (self.place_points[name][0], CRYPT)
+                if not place.exit or \
+                    insect not in self._place_insects[place.exit.name]:
+                    image = self._image_of.pop((name, insect))
+                    current.discard(insect)
+                    pos = (place_point[0], CRYPT)
                     self.canvas.slide_shape(image, pos, STRATEGY_SECONDS)
+            self._place_state[name] = state
 
     def _draw_insect(self, insect, place_name, random_offset=False, behind=0):
         """Draw an insect and store the ID of its image."""
         image_file = INSECT_FILES[insect.name]
-        pos = shift_point(self.place_points[place_name], PLACE_PADDING)
+        pos = self._pos_padded[place_name]
         if random_offset:
             pos = shift_point(pos, (random.randint(-10, 10), random.randint(-50, 50)))
         image = self.canvas.draw_image(pos, image_file, behind=behind)
-        self.images[place_name][insect] = image
+        self._image_of[(place_name, insect)] = image
+        self._place_insects[place_name].add(insect)
 
     def _throw(self, ant, colony):
         """Animate a leaf thrown at a Bee."""
         bee = ant.nearest_bee(colony.hive)  # nearest_bee logic from ants.py
         if bee:
-            start = shift_point(self.place_points[ant.place.name], LEAF_START_OFFSET)
-            end = shift_point(self.place_points[bee.place.name], LEAF_END_OFFSET)
-            animate_leaf(self.canvas, start, end, color=LEAF_COLORS[ant.name])
+            start = self._pos_leaf_start[ant.place.name]
+            end = self._pos_leaf_end[bee.place.name]
+            leaf = animate_leaf(self.canvas, start, end, LEAF_DURATION,
+                                color=LEAF_COLORS[ant.name])
+            self._clear_later(leaf, LEAF_DURATION)
 
     def _throw_dart(self, ant, colony):
         """Animate a dart thrown by a Ninja ant."""
         if ant.has_target(colony):
-            start = shift_point(self.place_points[ant.place.name], LEAF_START_OFFSET)
-            end = shift_point((self.place_points[colony.hive.name][0], self.place_points[ant.place.name][1]), LEAF_END_OFFSET)
-            animate_dart(self.canvas, start, end)
+            start = self._pos_leaf_start[ant.place.name]
+            end = (self._pos_leaf_end[colony.hive.name][0],
+                   self._pos_leaf_end[ant.place.name][1])
+            dart = animate_dart(self.canvas, start, end, DART_DURATION)
+            self._clear_later(dart, DART_DURATION)
+
+    def _clear_later(self, shape, delay):
+        """Queue a shape to be cleared by the next call to _clear_thrown."""
+        self._pending_clear.append((delay, shape))
+
+    def _clear_thrown(self):
+        """Clear all queued shapes with a single timer once the longest of
+        their animations has finished."""
+        if not self._pending_clear:
+            return
+        delay = max(delay for delay, _ in self._pending_clear)
+        shapes = [shape for _, shape in self._pending_clear]
+        self._pending_clear = []
+        self.canvas._tk.after(int(1000*delay) + 1,
+                              lambda: self.canvas._canvas.delete(*shapes))
+
+# Polygon vertices as (angle offset, fraction of length) pairs
+LEAF_SHAPE = ((-pi, 1/3), (-pi/2, 1/2), (0, 1), (pi/2, 1/2))
+DART_SHAPE = ((-pi, 1), (-pi*3/4, 1/5), (-pi/2, 1), (-pi/4, 1/5),
+              (0, 1), (pi/4, 1/5), (pi/2, 1), (pi*3/4, 1/5))
+
+@lru_cache(maxsize=256)
+def shape_offsets(shape, angle, length):
+    """Return the vertex offsets of shape rotated by angle and scaled by length.
+
+    Animations only use a handful of distinct angles, so results are cached.
+    """
+    return tuple((cos(angle + a) * length * f,
+                  sin(angle + a) * length * f) for a, f in shape)
+
+def shape_trajectory(shape, start, end, duration, length):
+    """Return the coordinates of shape in each frame as it spins from start
+    to end over duration seconds."""
+    num_frames = duration / graphics.FRAME_TIME
+    x, y = start
+    dx, dy = [(e-s) / num_frames for s, e in zip(start, end)]
+    trajectory = []
+    for i in range(int(duration // graphics.FRAME_TIME) + 1):
+        tx, ty = x + i*dx, y + i*dy
+        offsets = shape_offsets(shape, pi / 8 * i, length)
+        trajectory.append([(tx + ox, ty + oy) for ox, oy in offsets])
+    return trajectory
 
 def leaf_coords(pos, angle, length):
     """Return the coordinates of a leaf polygon."""
-    angles = [angle - pi, angle - pi/2, angle, angle + pi/2]
-    distances = [length/3, length/2, length, length/2]
-    return [graphics.translate_point(pos, a, d) for a, d in zip(angles, distances)]
+    x, y = pos
+    return [(x + dx, y + dy) for dx, dy in shape_offsets(LEAF_SHAPE, angle, length)]
 
-def animate_leaf(canvas, start, end, duration=0.3, color='ForestGreen'):
-    """Define the animation frames for a thrown leaf."""
+def animate_leaf(canvas, start, end, duration=LEAF_DURATION, color='ForestGreen'):
+    """Define the animation frames for a thrown leaf and return its id."""
     length = 40
     leaf = canvas.draw_polygon(leaf_coords(start, 0, length),
             color='DarkGreen', fill_color=color, smooth=1)
-    num_frames = duration / graphics.FRAME_TIME
-    increment = tuple([(e-s) / num_frames for s, e in zip(start, end)])
-    def points_fn(frame_count):
-        nonlocal start
-        angle = pi / 8 * frame_count
-        cs = leaf_coords(start, angle, length)
-        start = shift_point(start, increment)
-        return cs
-    canvas.animate_shape(leaf, duration, points_fn)
-    canvas._canvas.after(int(1000*duration) + 1, lambda: canvas.clear(leaf))
+    # Compute every frame of the animation up front
+    trajectory = shape_trajectory(LEAF_SHAPE, start, end, duration, length)
+    canvas.animate_shape(leaf, duration, trajectory.__getitem__)
+    return leaf
 
 def dart_coords(pos, angle, length):
     """Return the coordinates of a leaf polygon."""
-    angles = [angle-pi, angle-pi*3/4, angle-pi/2, angle-pi/4, angle, angle+pi/4, angle+pi/2, angle+pi*3/4]
-    distances = [length, length/5, length, length/5, length, length/5, length, length/5]
-    return [graphics.translate_point(pos, a, d) for a, d in zip(angles, distances)]
+    x, y = pos
+    return [(x + dx, y + dy) for dx, dy in shape_offsets(DART_SHAPE, angle, length)]
 
-def animate_dart(canvas, start, end, duration=0.5, color='Black'):
-    """Define the animation frames for a thrown leaf."""
+def animate_dart(canvas, start, end, duration=DART_DURATION, color='Black'):
+    """Define the animation frames for a thrown dart and return its id."""
     length = 40
     dart = canvas.draw_polygon(dart_coords(start, 0, length),
             color='DarkGreen', fill_color=color, smooth=1)
-    num_frames = duration / graphics.FRAME_TIME
-    increment = tuple([(e-s) / num_frames for s, e in zip(start, end)])
-    def points_fn(frame_count):
-        nonlocal start
-        angle = pi / 8 * frame_count
-        cs = dart_coords(start, angle, length)
-        start = shift_point(start, increment)
-        return cs
-    canvas.animate_shape(dart, duration, points_fn)
-    canvas._canvas.after(int(1000*duration) + 1, lambda: canvas.clear(dart))
+    # Compute every frame of the animation up front
+    trajectory = shape_trajectory(DART_SHAPE, start, end, duration, length)
+    canvas.animate_shape(dart, duration, trajectory.__getitem__)
+    return dart
 
 @main
 def run(*args):
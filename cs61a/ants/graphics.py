@@ -38,7 +38,7 @@ class Canvas(object):
         self._tk.protocol('WM_DELETE_WINDOW', sys.exit)
         self._tk.title(title or 'Graphics Window')
         self._tk.bind('<Button-1>', self._click)
-        self._click_pos = None
+        self._clicks = []  # Click positions not yet returned
         
         # Canvas object
         self._canvas = tkinter.Canvas(self._tk, width=width, height=height)
@@ -79,8 +79,8 @@ class Canvas(object):
         x1, y1 = [c + radius for c in center]
         return self._canvas.create_oval(x0, y0, x1, y1, outline=color, fill=fill_color, width=width)
 
-    def draw_image(self, pos, image_file=None, scale=1, anchor=tkinter.NW, behind=0):
-        """Draw an image from a file and return its tkinter id."""
+    def load_image(self, image_file, scale=1):
+        """Load an image from a file, reusing it if it was already loaded."""
         key = (image_file, scale)
         if key not in self._images:
             image = tkinter.PhotoImage(file=image_file)
@@ -89,8 +89,11 @@ class Canvas(object):
             else:
                 image = image.subsample(int(1/scale))
             self._images[key] = image 
+        return self._images[key]
 
-        image = self._images[key]
+    def draw_image(self, pos, image_file=None, scale=1, anchor=tkinter.NW, behind=0):
+        """Draw an image from a file and return its tkinter id."""
+        image = self.load_image(image_file, scale)
         x, y = pos
         id = self._canvas.create_image(x, y, image=image, anchor=anchor)
         if behind > 0:
@@ -148,21 +151,24 @@ class Canvas(object):
         """
         elapsed = 0
         while elapsed < seconds or seconds == 0:
-            if self._click_pos is not None:
-                pos = self._click_pos
-                self._click_pos = None
-                return pos, elapsed
+            if self._clicks:
+                return self._clicks.pop(0), elapsed
             self._sleep(FRAME_TIME)
             elapsed += FRAME_TIME
         return None, elapsed
 
+    def take_clicks(self):
+        """Return the positions of all pending clicks without waiting."""
+        clicks, self._clicks = self._clicks, []
+        return clicks
+
     def _draw_background(self):
         w, h = self.width - 1, self.height - 1
         corners = [(0,0), (0, h), (w, h), (w, 0)]
         self.draw_polygon(corners, self.color, fill_color=self.color, filled=True, smooth=False)
 
     def _click(self, event):
-        self._click_pos = (event.x, event.y)
+        self._clicks.append((event.x, event.y))
 
     def _sleep(self, seconds):
         self._tk.update_idletasks()